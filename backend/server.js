@@ -37,6 +37,52 @@ let currentLyrics = "";
 let currentBPM = 0;
 let audioAnalysisData = {};
 
+// Event codes of the packed 'audio_analysis_bin' record (must match ai_audio_analyzer.py)
+const EVENT_TYPES = ['rhythm', 'bass_drop', 'vocal', 'build'];
+const ANALYSIS_RECORD_SIZE = 29;
+
+// Decode the 29-byte little-endian record: uint8 event code, float32 intensity,
+// bpm, bass, mid, high energies, float64 timestamp (seconds)
+function decodeAudioAnalysis(buf) {
+  return {
+    event_type: EVENT_TYPES[buf.readUInt8(0)] || 'rhythm',
+    intensity: Math.round(buf.readFloatLE(1) * 1000) / 1000,
+    bpm: Math.round(buf.readFloatLE(5)),
+    bass_energy: Math.round(buf.readFloatLE(9)),
+    mid_energy: Math.round(buf.readFloatLE(13)),
+    high_energy: Math.round(buf.readFloatLE(17)),
+    timestamp: buf.readDoubleLE(21)
+  };
+}
+
+// Advanced AI audio analysis event (JSON or decoded binary)
+function handleAudioAnalysis(data) {
+  const eventIcons = {
+    'bass_drop': '💥',
+    'vocal': '🎤',
+    'rhythm': '🎵',
+    'build': '📈'
+  };
+
+  const icon = eventIcons[data.event_type] || '⚡';
+  console.log(`${icon} ${data.event_type} detected! BPM: ${data.bpm}, Intensity: ${data.intensity}`);
+
+  // Store audio data
+  audioAnalysisData = data;
+  currentBPM = data.bpm;
+
+  // Broadcast to all clients with enhanced data
+  io.emit('audio_analysis', data);
+
+  // Also send flash_pulse for backward compatibility
+  io.emit('flash_pulse', {
+    timestamp: data.timestamp || Date.now(),
+    intensity: data.intensity,
+    event_type: data.event_type,
+    bpm: data.bpm
+  });
+}
+
 // Connection handler
 io.on('connection', (socket) => {
   console.log(`✅ Client connected: ${socket.id}`);
@@ -72,31 +118,16 @@ io.on('connection', (socket) => {
   });
 
   // Advanced AI audio analysis event
-  socket.on('audio_analysis', (data) => {
-    const eventIcons = {
-      'bass_drop': '💥',
-      'vocal': '🎤',
-      'rhythm': '🎵',
-      'build': '📈'
-    };
-
-    const icon = eventIcons[data.event_type] || '⚡';
-    console.log(`${icon} ${data.event_type} detected! BPM: ${data.bpm}, Intensity: ${data.intensity}`);
-
-    // Store audio data
-    audioAnalysisData = data;
-    currentBPM = data.bpm;
-
-    // Broadcast to all clients with enhanced data
-    io.emit('audio_analysis', data);
-
-    // Also send flash_pulse for backward compatibility
-    io.emit('flash_pulse', {
-      timestamp: data.timestamp || Date.now(),
-      intensity: data.intensity,
-      event_type: data.event_type,
-      bpm: data.bpm
-    });
+  socket.on('audio_analysis', handleAudioAnalysis);
+
+  // Same event as a packed binary record (sent by ai_audio_analyzer.py)
+  socket.on('audio_analysis_bin', (buf) => {
+    // Any client can send this event - a bad record must not throw inside the listener
+    if (!Buffer.isBuffer(buf) || buf.length !== ANALYSIS_RECORD_SIZE) {
+      console.log(`⚠️  Dropped malformed audio_analysis_bin record from ${socket.id}`);
+      return;
+    }
+    handleAudioAnalysis(decodeAudioAnalysis(buf));
   });
 
   // Live lyrics update
@@ -0,0 +1,329 @@
+"""
+Let-It-Up Shared Audio Core
+
+Single implementation of the real-time audio hot path used by
+dj_listener.py, ai_audio_analyzer.py, live_song_analyzer.py and the
+rhythm test scripts:
+1. RingHistory - rolling history with an O(1) mean
+2. rms_i16 / i16_to_f32_norm - single-pass int16 kernels
+3. analyze_bands - windowed, pre-planned FFT + per-band magnitude sums
+   (band_energies_batch does the band sums for a whole file's spectra)
+4. open_input_stream - PyAudio input stream on a real-time callback thread
+5. start_emitter / flush_emitter - socket writes on a background thread
+
+Author: Senior Full Stack Architect
+"""
+
+import math
+import os
+import threading
+import numpy as np
+from scipy import fft as spfft
+import config
+
+# Callers report a missing PyAudio themselves
+try:
+    import pyaudio
+except ImportError:
+    pyaudio = None
+
+# Optional: pyFFTW runs a pre-planned, SIMD-vectorized real FFT
+try:
+    import pyfftw
+    PYFFTW_AVAILABLE = True
+except ImportError:
+    PYFFTW_AVAILABLE = False
+    print("⚠️  pyFFTW not available - falling back to scipy.fft")
+
+# Optional: Numba compiles the DSP kernels to fused native loops
+try:
+    from numba import njit, prange, types
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+    print("⚠️  Numba not available - falling back to NumPy reductions")
+
+
+INT16_SCALE = np.float32(1.0 / 32768.0)
+
+
+# ============================================================================
+# ROLLING HISTORY
+# ============================================================================
+
+class RingHistory:
+    """
+    Fixed-size float32 history with an O(1) running mean.
+    Replaces deque(maxlen=N) + np.mean() on the audio callback path.
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self.values = np.zeros(size, dtype=np.float32)
+        self.index = 0      # Total number of appends (monotonic)
+        self.total = 0.0    # Running sum of the stored values
+
+    def append(self, value):
+        slot = self.index % self.size
+        self.total += value - self.values[slot]
+        self.values[slot] = value
+        self.index += 1
+
+        # Re-sync the running sum once per lap so float error can't accumulate
+        if slot == self.size - 1:
+            self.total = float(self.values.sum(dtype=np.float64))
+
+    def __len__(self):
+        return min(self.index, self.size)
+
+    def mean(self):
+        count = len(self)
+        return self.total / count if count else 0.0
+
+
+# ============================================================================
+# FFT BUFFERS
+# ============================================================================
+
+# Reusable FFT buffers - planned once, reused on every audio callback
+if PYFFTW_AVAILABLE:
+    _fft_in = pyfftw.empty_aligned(config.CHUNK_SIZE, dtype='float32')
+    _fft_out = pyfftw.empty_aligned(config.CHUNK_SIZE // 2 + 1, dtype='complex64')
+    _fft = pyfftw.FFTW(_fft_in, _fft_out, flags=('FFTW_MEASURE', 'FFTW_DESTROY_INPUT'), threads=1)
+else:
+    _fft_in = np.empty(config.CHUNK_SIZE, dtype=np.float32)
+    _fft_out = np.empty(config.CHUNK_SIZE // 2 + 1, dtype=np.complex64)
+
+    def _fft():
+        # scipy keeps float32 -> complex64 (np.fft.rfft would round-trip through complex128)
+        _fft_out[:] = spfft.rfft(_fft_in, overwrite_x=True)
+        return _fft_out
+
+
+def hann_window(size):
+    """
+    Hann window against spectral leakage, scaled to unit RMS so broadband band
+    energies keep the unwindowed FFT's magnitude (the absolute floors stay valid).
+    Tones still shift a little: side lobes stay in the band, so a bin-centred
+    tone sums ~1.6x higher and an off-bin tone ~0.9-1.0x.
+    """
+    window = np.hanning(size)
+    return (window / np.sqrt(np.mean(window * window))).astype(np.float32)
+
+
+_window = hann_window(config.CHUNK_SIZE)
+
+# FFT bin frequencies (CHUNK_SIZE and SAMPLE_RATE are fixed, so compute once)
+_freqs = np.fft.rfftfreq(config.CHUNK_SIZE, 1/config.SAMPLE_RATE)
+
+
+def band_bins(band):
+    """Return (lo, hi) FFT bin indices covering band[0] <= f <= band[1] Hz"""
+    lo = int(np.searchsorted(_freqs, band[0], side='left'))
+    hi = int(np.searchsorted(_freqs, band[1], side='right'))
+    return lo, hi
+
+
+def band_table(*bands):
+    """Build the (n_bands, 2) bin table that analyze_bands expects"""
+    return np.array([band_bins(band) for band in bands], dtype=np.int64)
+
+
+# ============================================================================
+# DSP KERNELS
+# ============================================================================
+
+if NUMBA_AVAILABLE:
+    # Explicit signatures compile every kernel eagerly at import, so the audio
+    # callback runs machine code from its first chunk. np.frombuffer views of
+    # callback bytes are read-only arrays - a distinct Numba type - so int16
+    # inputs get both a read-only and a writeable signature.
+    _I16_RO = types.Array(types.int16, 1, 'C', readonly=True)
+    _I16 = types.int16[::1]
+    _F32 = types.float32[::1]
+
+    @njit([types.float64[::1](types.complex64[::1], types.int64[:, ::1], types.float64[::1])],
+          cache=True, fastmath=True, nogil=True)
+    def band_energies(spectrum, bins, out):
+        """
+        Sum FFT magnitudes over each (lo, hi) bin range into out.
+        Reads the complex spectrum directly - no magnitude array is materialized.
+        """
+        for b in range(bins.shape[0]):
+            acc = 0.0
+            for i in range(bins[b, 0], bins[b, 1]):
+                re = spectrum[i].real
+                im = spectrum[i].imag
+                acc += math.sqrt(re * re + im * im)
+            out[b] = acc
+        return out
+
+    # Offline (file analysis) kernel: compiled on first use, rows split across cores
+    @njit(cache=True, fastmath=True, parallel=True)
+    def band_energies_batch(spectra, bins, out):
+        """band_energies for every row of a (n_chunks, n_bins) spectrum array into out[n_chunks, n_bands]"""
+        for f in prange(spectra.shape[0]):
+            for b in range(bins.shape[0]):
+                acc = 0.0
+                for i in range(bins[b, 0], bins[b, 1]):
+                    re = spectra[f, i].real
+                    im = spectra[f, i].imag
+                    acc += math.sqrt(re * re + im * im)
+                out[f, b] = acc
+        return out
+
+    @njit([types.float64(_I16_RO), types.float64(_I16)], cache=True, fastmath=True, nogil=True)
+    def rms_i16(samples):
+        """Single-pass RMS straight from int16 samples - no temporaries"""
+        acc = 0.0
+        for i in range(samples.size):
+            v = float(samples[i])
+            acc += v * v
+        return math.sqrt(acc / samples.size)
+
+    @njit([types.void(_I16_RO, _F32), types.void(_I16, _F32)], cache=True, fastmath=True, nogil=True)
+    def i16_to_f32_norm(src, dst):
+        """Convert int16 samples into dst as float32 in [-1, 1) in a single pass"""
+        inv = np.float32(1.0 / 32768.0)
+        for i in range(src.size):
+            dst[i] = src[i] * inv
+else:
+    def band_energies(spectrum, bins, out):
+        """Sum FFT magnitudes over each (lo, hi) bin range into out (any spectrum length)"""
+        for b in range(bins.shape[0]):
+            out[b] = np.abs(spectrum[bins[b, 0]:bins[b, 1]]).sum()
+        return out
+
+    def band_energies_batch(spectra, bins, out):
+        """band_energies for every row of a (n_chunks, n_bins) spectrum array into out[n_chunks, n_bands]"""
+        for b in range(bins.shape[0]):
+            out[:, b] = np.abs(spectra[:, bins[b, 0]:bins[b, 1]]).sum(axis=1)
+        return out
+
+    def rms_i16(samples):
+        """RMS of int16 samples (widened to avoid int16 overflow when squaring)"""
+        x = samples.astype(np.float32)
+        return math.sqrt(np.dot(x, x) / x.size)
+
+    def i16_to_f32_norm(src, dst):
+        """Convert int16 samples into dst as float32 in [-1, 1)"""
+        np.multiply(src, INT16_SCALE, out=dst, dtype=np.float32)
+
+
+def analyze_bands(audio_data, bins, out):
+    """
+    Windowed FFT of one CHUNK_SIZE chunk, summing magnitudes per band.
+    bins comes from band_table(); out is a float64 array with one slot per band.
+    Broadband energies stay on the unwindowed scale the callers' absolute
+    floors were tuned on (see hann_window for the tonal gain).
+    Returns: out
+    """
+    # Unit-RMS window straight into the FFT input
+    np.multiply(audio_data, _window, out=_fft_in, casting='unsafe')
+    _fft()
+    return band_energies(_fft_out, bins, out)
+
+
+def warm_up_kernels():
+    """Run the FFT and kernels once so the first audio callback doesn't pay first-call setup"""
+    # Same read-only int16 view type the callbacks get from np.frombuffer
+    silence = np.frombuffer(bytes(config.CHUNK_SIZE * 2), dtype=np.int16)
+    scratch = np.empty(config.CHUNK_SIZE, dtype=np.float32)
+
+    rms_i16(silence)
+    analyze_bands(silence, band_table((20, 250)), np.zeros(1))
+    i16_to_f32_norm(silence, scratch)
+
+
+# ============================================================================
+# AUDIO STREAM
+# ============================================================================
+
+def prepare_realtime_thread():
+    """
+    Give the calling thread (the PortAudio callback thread) real-time priority
+    and optionally pin it to one CPU core. Linux only; skipped with a warning
+    when the process lacks permission.
+    """
+    if config.AUDIO_CPU is not None and hasattr(os, 'sched_setaffinity'):
+        try:
+            os.sched_setaffinity(0, {config.AUDIO_CPU})
+        except OSError as e:
+            print(f"⚠️  Could not pin audio thread to CPU {config.AUDIO_CPU}: {e}")
+
+    if hasattr(os, 'sched_setscheduler'):
+        try:
+            os.sched_setscheduler(0, os.SCHED_FIFO, os.sched_param(config.AUDIO_RT_PRIORITY))
+        except OSError as e:
+            print(f"⚠️  Real-time scheduling unavailable: {e}")
+
+
+def open_input_stream(p, callback, device_index=None):
+    """
+    Open the int16 input stream (config rate/channels/chunk) on PyAudio instance p.
+    The PortAudio thread gets real-time priority on the first callback.
+    Returns: the opened stream (not yet started)
+    """
+    realtime_ready = False
+
+    def realtime_callback(in_data, frame_count, time_info, status):
+        nonlocal realtime_ready
+        if not realtime_ready:
+            prepare_realtime_thread()
+            realtime_ready = True
+        return callback(in_data, frame_count, time_info, status)
+
+    return p.open(
+        format=pyaudio.paInt16,
+        channels=config.CHANNELS,
+        rate=config.SAMPLE_RATE,
+        input=True,
+        input_device_index=device_index,
+        frames_per_buffer=config.CHUNK_SIZE,
+        stream_callback=realtime_callback
+    )
+
+
+# ============================================================================
+# SOCKET EMITTER
+# ============================================================================
+
+def start_emitter(sio, emit_q, on_emit=None):
+    """
+    Start the daemon thread that performs every socket write queued on emit_q.
+    Keeps JSON encoding and network I/O off the audio callback thread.
+    Items are (event, payload, ...) tuples; on_emit(item) runs on the emitter
+    thread before each write (console feedback). Writes are skipped while sio
+    is disconnected.
+    """
+    def run():
+        while True:
+            item = emit_q.get()
+
+            # flush_emitter's marker: everything queued before it has been sent
+            if isinstance(item, threading.Event):
+                item.set()
+                return
+
+            if on_emit is not None:
+                on_emit(item)
+
+            event, payload = item[0], item[1]
+            try:
+                if sio.connected:
+                    sio.emit(event, payload)
+            except Exception as e:
+                print(f"❌ Error sending {event}: {e}")
+
+    threading.Thread(target=run, daemon=True).start()
+
+
+def flush_emitter(emit_q, timeout=2.0):
+    """
+    Stop the emitter thread once it has sent everything already queued.
+    Call before sio.disconnect(); waits at most timeout seconds.
+    Returns: True if the queue drained in time
+    """
+    done = threading.Event()
+    emit_q.put(done)
+    return done.wait(timeout)
@@ -5,22 +5,35 @@ Advanced audio analysis system that:
 1. Detects bass frequencies and drops
 2. Analyzes rhythm patterns and BPM
 3. Identifies vocal presence
-4. Performs real-time speech-to-text for live lyrics
+4. Performs real-time speech-to-text for live lyrics (local Vosk model when installed)
 5. Sends intelligent flash triggers based on music analysis
 
 Author: Senior Full Stack Architect
 """
 
+import gc
+import json
+import struct
 import pyaudio
 import numpy as np
 import librosa
+from scipy.signal import resample_poly
 import socketio
 import time
 import speech_recognition as sr
-from collections import deque
 import threading
 import queue
 import config
+from _audio_core import (RingHistory, band_table, analyze_bands, rms_i16, i16_to_f32_norm,
+                         warm_up_kernels, open_input_stream, start_emitter, flush_emitter)
+
+# Optional: Vosk runs speech recognition locally (no network round trip)
+try:
+    from vosk import Model, KaldiRecognizer, SetLogLevel
+    VOSK_AVAILABLE = True
+except ImportError:
+    VOSK_AVAILABLE = False
+    print("⚠️  Vosk not available - falling back to Google Speech Recognition")
 
 # Initialize Socket.io client
 sio = socketio.Client()
@@ -30,10 +43,40 @@ audio_stream = None
 p = None
 
 # Audio analysis state
-volume_history = deque(maxlen=config.HISTORY_SIZE)
-last_flash_time = 0
+volume_history = RingHistory(config.HISTORY_SIZE)
+last_flash_ns = 0  # time.monotonic_ns() of the last flash
+COOLDOWN_NS = config.COOLDOWN_MS * 1_000_000
 current_bpm = 0
 lyrics_queue = queue.Queue()
+emit_q = queue.SimpleQueue()  # (event, payload) pairs for start_emitter's thread
+FULL_GC_TICKS = 600  # Main-loop ticks (100 ms) between full GC passes while automatic GC is off
+
+# Packed 'audio_analysis_bin' record: event code, intensity, bpm, bass, mid,
+# high energies (float32) and timestamp (float64) - decoded in backend/server.js
+EVENT_CODES = {'rhythm': 0, 'bass_drop': 1, 'vocal': 2, 'build': 3}
+ANALYSIS_RECORD = struct.Struct('<Bfffffd')
+
+# Smoothed band baselines (exponential moving averages)
+bass_ema = 0.0
+mid_ema = 0.0
+ema_samples = 0
+bass_streak = 0   # Consecutive chunks with rising bass energy
+prev_bass = 0.0
+
+# Audio ring buffer: the audio callback only writes into it, bpm_worker and the
+# Vosk lyrics worker read it
+BPM_RING_SECONDS = 4        # Seconds of audio used for each BPM estimate
+BPM_INTERVAL = 2.0          # Seconds between BPM estimates
+BPM_DOWNSAMPLE = 4          # Beat tracking only needs low-rate onsets: 44.1 kHz -> 11.025 kHz
+BPM_SAMPLE_RATE = config.SAMPLE_RATE // BPM_DOWNSAMPLE
+BPM_N_FFT = 512             # librosa's 2048/512 defaults scaled to the lower rate
+BPM_HOP_LENGTH = 128
+BPM_N_MELS = 128
+_bpm_ring = np.zeros(config.SAMPLE_RATE * BPM_RING_SECONDS, dtype=np.int16)
+_bpm_write_idx = 0
+_bpm_float = np.empty(_bpm_ring.size, dtype=np.float32)
+_mel_basis = librosa.filters.mel(sr=BPM_SAMPLE_RATE, n_fft=BPM_N_FFT, n_mels=BPM_N_MELS)
+LYRICS_INTERVAL = 0.25      # Seconds between feeding new audio to the Vosk recognizer
 
 # Frequency bands (Hz)
 BASS_RANGE = (20, 250)      # Bass frequencies
@@ -41,87 +84,118 @@ MID_RANGE = (250, 2000)     # Mid frequencies
 HIGH_RANGE = (2000, 8000)   # High frequencies
 VOCAL_RANGE = (300, 3400)   # Human voice range
 
+# FFT bin ranges for the four bands, plus their reused output slots
+BAND_BINS = band_table(BASS_RANGE, MID_RANGE, HIGH_RANGE, VOCAL_RANGE)
+_band_energy = np.zeros(len(BAND_BINS))
 
-def analyze_frequency_bands(audio_data, sample_rate):
-    """
-    Analyze audio across different frequency bands using FFT.
-    Returns: bass_energy, mid_energy, high_energy, vocal_energy
-    """
-    # Perform FFT
-    fft = np.fft.rfft(audio_data)
-    frequencies = np.fft.rfftfreq(len(audio_data), 1/sample_rate)
-    magnitudes = np.abs(fft)
 
-    # Calculate energy in each band
-    bass_mask = (frequencies >= BASS_RANGE[0]) & (frequencies <= BASS_RANGE[1])
-    mid_mask = (frequencies >= MID_RANGE[0]) & (frequencies <= MID_RANGE[1])
-    high_mask = (frequencies >= HIGH_RANGE[0]) & (frequencies <= HIGH_RANGE[1])
-    vocal_mask = (frequencies >= VOCAL_RANGE[0]) & (frequencies <= VOCAL_RANGE[1])
+def update_band_averages(bass_energy, mid_energy):
+    """Fold the latest bass/mid energies into their moving averages"""
+    global bass_ema, mid_ema, ema_samples, bass_streak, prev_bass
 
-    bass_energy = np.sum(magnitudes[bass_mask])
-    mid_energy = np.sum(magnitudes[mid_mask])
-    high_energy = np.sum(magnitudes[high_mask])
-    vocal_energy = np.sum(magnitudes[vocal_mask])
+    if ema_samples == 0:
+        # Seed with the first chunk so the average doesn't ramp up from zero
+        bass_ema = bass_energy
+        mid_ema = mid_energy
+    else:
+        bass_ema += config.EMA_ALPHA * (bass_energy - bass_ema)
+        mid_ema += config.EMA_ALPHA * (mid_energy - mid_ema)
+    ema_samples += 1
 
-    return bass_energy, mid_energy, high_energy, vocal_energy
+    bass_streak = bass_streak + 1 if bass_energy > prev_bass else 0
+    prev_bass = bass_energy
 
 
-def detect_bass_drop(bass_energy, bass_history):
+def detect_bass_drop(bass_energy):
     """
     Detect sudden bass increases (bass drops).
     Returns: True if bass drop detected
     """
-    if len(bass_history) < 5:
+    if ema_samples < 5:
         return False
 
-    avg_bass = np.mean(bass_history)
-    threshold = avg_bass * 2.0  # 200% increase = bass drop
+    threshold = bass_ema * 2.0  # 200% increase = bass drop
 
     return bass_energy > threshold and bass_energy > 5000  # Minimum energy threshold
 
 
-def estimate_bpm(audio_data, sample_rate):
+def estimate_bpm(audio_float, sample_rate):
     """
     Estimate BPM using librosa's beat tracking.
+    Expects normalized float32 audio; the mel filterbank is cached at import.
     Returns: estimated BPM
     """
     try:
-        # Convert to float32 for librosa
-        audio_float = audio_data.astype(np.float32) / np.iinfo(np.int16).max
+        # Polyphase downsample - the onset pipeline then sees 4x fewer samples
+        y_low = resample_poly(audio_float, up=1, down=BPM_DOWNSAMPLE).astype(np.float32)
+        sr_low = sample_rate // BPM_DOWNSAMPLE
+
+        # Onset envelope from a log-mel spectrogram (same as librosa's defaults)
+        stft = librosa.stft(y_low, n_fft=BPM_N_FFT, hop_length=BPM_HOP_LENGTH)
+        mel_db = librosa.power_to_db(_mel_basis @ (np.abs(stft) ** 2))
+        onset_env = librosa.onset.onset_strength(S=mel_db, sr=sr_low)
 
         # Estimate tempo
-        tempo, _ = librosa.beat.beat_track(y=audio_float, sr=sample_rate)
+        tempo, _ = librosa.beat.beat_track(onset_envelope=onset_env, sr=sr_low,
+                                           hop_length=BPM_HOP_LENGTH)
         return tempo
     except:
         return 0
 
 
-def calculate_rms(audio_data):
-    """Calculate RMS volume (overall loudness)"""
-    rms = np.sqrt(np.mean(audio_data**2))
-    return rms
+def write_bpm_ring(audio_data):
+    """Copy a chunk into the BPM ring buffer (single writer: the audio callback)"""
+    global _bpm_write_idx
+
+    idx = _bpm_write_idx
+    end = idx + len(audio_data)
+    if end <= _bpm_ring.size:
+        np.copyto(_bpm_ring[idx:end], audio_data)
+    else:
+        split = _bpm_ring.size - idx
+        np.copyto(_bpm_ring[idx:], audio_data[:split])
+        np.copyto(_bpm_ring[:end - _bpm_ring.size], audio_data[split:])
+
+    # Publish the new write position last (a single int store is atomic under the GIL)
+    _bpm_write_idx = end % _bpm_ring.size
+
+
+def bpm_worker():
+    """
+    Background thread for BPM estimation.
+    Keeps librosa's beat tracking off the audio callback thread.
+    """
+    global current_bpm
+
+    while True:
+        time.sleep(BPM_INTERVAL)
+
+        # Snapshot the ring oldest-to-newest, normalizing into the reused float buffer
+        idx = _bpm_write_idx
+        tail = _bpm_ring.size - idx
+        i16_to_f32_norm(_bpm_ring[idx:], _bpm_float[:tail])
+        i16_to_f32_norm(_bpm_ring[:idx], _bpm_float[tail:])
 
+        current_bpm = estimate_bpm(_bpm_float, config.SAMPLE_RATE)
 
-def detect_rhythm_event(bass_energy, mid_energy, bass_history, mid_history):
+
+def detect_rhythm_event(bass_energy, mid_energy):
     """
     Detect various rhythm events based on frequency analysis.
     Returns: event_type ('bass_drop', 'vocal', 'rhythm', 'build', None)
     """
-    global last_flash_time
-
-    # Cooldown check
-    current_time = time.time() * 1000
-    if current_time - last_flash_time < config.COOLDOWN_MS:
+    # Cooldown check (monotonic clock, immune to wall-clock adjustments)
+    if time.monotonic_ns() - last_flash_ns < COOLDOWN_NS:
         return None
 
-    if len(bass_history) < 5 or len(mid_history) < 5:
+    if ema_samples < 5:
         return None
 
-    avg_bass = np.mean(bass_history)
-    avg_mid = np.mean(mid_history)
+    avg_bass = bass_ema
+    avg_mid = mid_ema
 
     # Bass drop detection (strongest event)
-    if detect_bass_drop(bass_energy, bass_history):
+    if detect_bass_drop(bass_energy):
         return 'bass_drop'
 
     # Strong bass (rhythmic beat)
@@ -132,50 +206,68 @@ def detect_rhythm_event(bass_energy, mid_energy, bass_history, mid_history):
     if mid_energy > avg_mid * 1.3 and mid_energy > bass_energy * 1.2:
         return 'vocal'
 
-    # Build-up detection (gradual increase)
-    if len(bass_history) >= 5:
-        recent_bass = list(bass_history)[-5:]
-        if all(recent_bass[i] < recent_bass[i+1] for i in range(len(recent_bass)-1)):
-            return 'build'
+    # Build-up detection (bass rising over the last 5 chunks)
+    if bass_streak >= 4:
+        return 'build'
 
     return None
 
 
 def send_flash_event(event_type='rhythm', intensity=1.0, bpm=0, bass=0, mid=0, high=0):
     """
-    Send flash event with music analysis data to Node.js server.
+    Queue flash event with music analysis data for the Node.js server.
     """
-    try:
-        sio.emit('audio_analysis', {
-            'event_type': event_type,  # bass_drop, vocal, rhythm, build
-            'intensity': intensity,
-            'bpm': int(bpm),
-            'bass_energy': int(bass),
-            'mid_energy': int(mid),
-            'high_energy': int(high),
-            'timestamp': time.time()
-        })
-
-        icon = {'bass_drop': '💥', 'vocal': '🎤', 'rhythm': '🎵', 'build': '📈'}.get(event_type, '⚡')
-        print(f"{icon} {event_type.upper()} detected! BPM: {int(bpm)}, Intensity: {intensity:.2f}")
-
-        global last_flash_time
-        last_flash_time = time.time() * 1000
+    global last_flash_ns
 
-    except Exception as e:
-        print(f"❌ Error sending event: {e}")
+    emit_q.put(('audio_analysis_bin', ANALYSIS_RECORD.pack(
+        EVENT_CODES[event_type],  # bass_drop, vocal, rhythm, build
+        intensity,
+        float(bpm),
+        float(bass),
+        float(mid),
+        float(high),
+        time.time()
+    )))
+    last_flash_ns = time.monotonic_ns()
+
+    icon = {'bass_drop': '💥', 'vocal': '🎤', 'rhythm': '🎵', 'build': '📈'}.get(event_type, '⚡')
+    print(f"{icon} {event_type.upper()} detected! BPM: {int(bpm)}, Intensity: {intensity:.2f}")
 
 
 def send_lyrics_update(lyrics_text):
-    """Send live lyrics to all clients"""
-    try:
-        sio.emit('lyrics_update', {
-            'text': lyrics_text,
-            'timestamp': time.time()
-        })
-        print(f"🎤 Lyrics: {lyrics_text}")
-    except Exception as e:
-        print(f"❌ Error sending lyrics: {e}")
+    """Queue live lyrics for all clients"""
+    emit_q.put(('lyrics_update', {
+        'text': lyrics_text,
+        'timestamp': time.time()
+    }))
+    print(f"🎤 Lyrics: {lyrics_text}")
+
+
+def vosk_lyrics_worker(model):
+    """
+    Stream new audio from the ring buffer into a local Vosk recognizer.
+    Runs continuously (no listen/recognize bursts) with no network calls.
+    """
+    recognizer = KaldiRecognizer(model, config.SAMPLE_RATE)
+    read_idx = _bpm_write_idx
+
+    print("🎤 Lyrics recognition thread started (Vosk, offline)...")
+
+    while True:
+        time.sleep(LYRICS_INTERVAL)
+
+        # Everything the audio callback wrote since the last pass
+        write_idx = _bpm_write_idx
+        if write_idx >= read_idx:
+            chunk = _bpm_ring[read_idx:write_idx].tobytes()
+        else:
+            chunk = _bpm_ring[read_idx:].tobytes() + _bpm_ring[:write_idx].tobytes()
+        read_idx = write_idx
+
+        if chunk and recognizer.AcceptWaveform(chunk):
+            text = json.loads(recognizer.Result())['text']
+            if text:
+                send_lyrics_update(text)
 
 
 def lyrics_recognition_thread():
@@ -183,6 +275,16 @@ def lyrics_recognition_thread():
     Background thread for real-time speech recognition.
     Converts live audio to text (lyrics).
     """
+    if VOSK_AVAILABLE:
+        try:
+            SetLogLevel(-1)
+            model = Model(config.VOSK_MODEL_PATH)
+        except Exception as e:
+            print(f"⚠️ Could not load Vosk model '{config.VOSK_MODEL_PATH}': {e}")
+        else:
+            vosk_lyrics_worker(model)
+            return
+
     recognizer = sr.Recognizer()
     mic = sr.Microphone()
 
@@ -218,7 +320,7 @@ def audio_callback(in_data, frame_count, time_info, status):
     """
     PyAudio callback - analyzes audio in real-time.
     """
-    global current_bpm, volume_history
+    global volume_history
 
     if status:
         print(f"⚠️ Audio status: {status}")
@@ -227,34 +329,20 @@ def audio_callback(in_data, frame_count, time_info, status):
     audio_data = np.frombuffer(in_data, dtype=np.int16)
 
     # Calculate overall volume (RMS)
-    rms_volume = calculate_rms(audio_data)
+    rms_volume = rms_i16(audio_data)
     volume_history.append(rms_volume)
 
     # Analyze frequency bands
-    bass, mid, high, vocal = analyze_frequency_bands(audio_data, config.SAMPLE_RATE)
-
-    # Maintain history for bass and mid
-    if not hasattr(audio_callback, 'bass_history'):
-        audio_callback.bass_history = deque(maxlen=10)
-        audio_callback.mid_history = deque(maxlen=10)
+    bass, mid, high, vocal = analyze_bands(audio_data, BAND_BINS, _band_energy)
 
-    audio_callback.bass_history.append(bass)
-    audio_callback.mid_history.append(mid)
+    # Update smoothed bass and mid baselines
+    update_band_averages(bass, mid)
 
-    # Estimate BPM (expensive, do less frequently)
-    if not hasattr(audio_callback, 'frame_counter'):
-        audio_callback.frame_counter = 0
-
-    audio_callback.frame_counter += 1
-    if audio_callback.frame_counter % 20 == 0:  # Every ~2 seconds
-        current_bpm = estimate_bpm(audio_data, config.SAMPLE_RATE)
+    # Feed the BPM worker (estimation itself runs off the audio thread)
+    write_bpm_ring(audio_data)
 
     # Detect rhythm events
-    event_type = detect_rhythm_event(
-        bass, mid,
-        audio_callback.bass_history,
-        audio_callback.mid_history
-    )
+    event_type = detect_rhythm_event(bass, mid)
 
     if event_type:
         # Calculate intensity based on event type
@@ -299,6 +387,7 @@ def start_listening():
     global audio_stream, p
 
     print("🎵 Initializing AI audio analysis system...")
+    warm_up_kernels()
 
     # Initialize PyAudio
     p = pyaudio.PyAudio()
@@ -312,25 +401,34 @@ def start_listening():
         print()
 
     try:
-        audio_stream = p.open(
-            format=pyaudio.paInt16,
-            channels=config.CHANNELS,
-            rate=config.SAMPLE_RATE,
-            input=True,
-            frames_per_buffer=config.CHUNK_SIZE,
-            stream_callback=audio_callback
-        )
+        audio_stream = open_input_stream(p, audio_callback)
 
         print("🎤 AI Audio Analysis started!")
         print(f"⚙️  Features: Bass Detection, Rhythm Analysis, BPM Tracking, Live Lyrics")
         print(f"⚙️  Settings: Sample Rate={config.SAMPLE_RATE}Hz, Chunk={config.CHUNK_SIZE}")
         print("🎧 Play music with vocals to see lyrics appear!\n")
 
+        # Move startup objects out of the collector's view and stop automatic
+        # collections, so a GC pause can't land in the middle of a callback
+        gc.collect()
+        gc.freeze()
+        gc.disable()
+
         audio_stream.start_stream()
 
+        ticks = 0  # 100 ms main-loop ticks
         while audio_stream.is_active():
             time.sleep(0.1)
 
+            # Collect cyclic garbage from this thread instead: young generations
+            # every second, plus a full pass every minute so objects promoted to
+            # the oldest generation (BPM, lyrics, socket threads) are reclaimed too
+            ticks += 1
+            if ticks % FULL_GC_TICKS == 0:
+                gc.collect()
+            elif ticks % 10 == 0:
+                gc.collect(1)
+
     except Exception as e:
         print(f"❌ Error opening audio stream: {e}")
         print("\n💡 Troubleshooting:")
@@ -345,6 +443,8 @@ def cleanup():
 
     print("\n🛑 Shutting down AI audio analyzer...")
 
+    gc.enable()
+
     if audio_stream:
         audio_stream.stop_stream()
         audio_stream.close()
@@ -353,6 +453,7 @@ def cleanup():
         p.terminate()
 
     if sio.connected:
+        flush_emitter(emit_q)
         sio.disconnect()
 
     print("✅ Cleanup complete")
@@ -366,6 +467,9 @@ def main():
     print("╚════════════════════════════════════════════════════╝\n")
 
     try:
+        # Start the socket writer before anything can queue events
+        start_emitter(sio, emit_q)
+
         # Connect to Node.js server
         print(f"🔌 Connecting to server: {config.SERVER_URL}")
         sio.connect(config.SERVER_URL)
@@ -375,6 +479,10 @@ def main():
         lyrics_thread = threading.Thread(target=lyrics_recognition_thread, daemon=True)
         lyrics_thread.start()
 
+        # Start BPM estimation in background thread
+        bpm_thread = threading.Thread(target=bpm_worker, daemon=True)
+        bpm_thread.start()
+
         # Start audio analysis (main thread)
         time.sleep(1)
         start_listening()
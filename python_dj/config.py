@@ -14,6 +14,14 @@ CHANNELS = 1  # Mono audio input
 VOLUME_THRESHOLD_MULTIPLIER = 1.5  # Multiplier for dynamic threshold (1.5 = 150% of average)
 COOLDOWN_MS = 250  # Minimum milliseconds between flashes (250ms = 4 flashes/sec max)
 HISTORY_SIZE = 10  # Number of chunks to keep for rolling average
+EMA_ALPHA = 0.1  # Smoothing factor for running band averages (higher = reacts faster)
+
+# Real-time Audio Thread (Linux; needs CAP_SYS_NICE or an rtprio limit, skipped otherwise)
+AUDIO_RT_PRIORITY = 80  # SCHED_FIFO priority for the audio callback thread
+AUDIO_CPU = None  # Pin the audio callback thread to this CPU core (None = no pinning)
+
+# Live Lyrics (ai_audio_analyzer.py)
+VOSK_MODEL_PATH = "vosk-model-small-en-us"  # Unzipped model from https://alphacephei.com/vosk/models
 
 # Sensitivity (adjust based on your environment)
 MIN_VOLUME_THRESHOLD = 500  # Minimum RMS volume to trigger (filters out silence)
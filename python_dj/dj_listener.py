@@ -13,8 +13,8 @@ import pyaudio
 import numpy as np
 import socketio
 import time
-from collections import deque
 import config
+from _audio_core import RingHistory, rms_i16, warm_up_kernels, open_input_stream
 
 # Initialize Socket.io client
 sio = socketio.Client()
@@ -24,18 +24,9 @@ audio_stream = None
 p = None
 
 # Beat detection state
-volume_history = deque(maxlen=config.HISTORY_SIZE)
-last_flash_time = 0
-
-
-def calculate_rms(audio_data):
-    """
-    Calculate Root Mean Square (RMS) volume of audio data.
-    RMS gives us the "energy" or "loudness" of the audio.
-    """
-    audio_array = np.frombuffer(audio_data, dtype=np.int16)
-    rms = np.sqrt(np.mean(audio_array**2))
-    return rms
+volume_history = RingHistory(config.HISTORY_SIZE)
+last_flash_ns = 0  # time.monotonic_ns() of the last flash
+COOLDOWN_NS = config.COOLDOWN_MS * 1_000_000
 
 
 def detect_beat(rms_volume):
@@ -47,7 +38,7 @@ def detect_beat(rms_volume):
     - If current volume > (average * threshold), it's a beat
     - Apply cooldown to prevent rapid-fire triggers
     """
-    global last_flash_time, volume_history
+    global last_flash_ns, volume_history
 
     # Add current volume to history
     volume_history.append(rms_volume)
@@ -57,7 +48,7 @@ def detect_beat(rms_volume):
         return False
 
     # Calculate dynamic threshold based on recent average
-    avg_volume = np.mean(volume_history)
+    avg_volume = volume_history.mean()
     threshold = max(
         config.MIN_VOLUME_THRESHOLD,
         min(avg_volume * config.VOLUME_THRESHOLD_MULTIPLIER, config.MAX_VOLUME_THRESHOLD)
@@ -67,11 +58,10 @@ def detect_beat(rms_volume):
     is_beat = rms_volume > threshold
 
     # Apply cooldown mechanism
-    current_time = time.time() * 1000  # Convert to milliseconds
-    time_since_last_flash = current_time - last_flash_time
+    now = time.monotonic_ns()  # Monotonic, immune to wall-clock adjustments
 
-    if is_beat and time_since_last_flash >= config.COOLDOWN_MS:
-        last_flash_time = current_time
+    if is_beat and now - last_flash_ns >= COOLDOWN_NS:
+        last_flash_ns = now
 
         if config.VERBOSE:
             print(f"🔊 BEAT DETECTED! Volume: {rms_volume:.0f} | Threshold: {threshold:.0f} | "
@@ -122,8 +112,8 @@ def audio_callback(in_data, frame_count, time_info, status):
     if status:
         print(f"⚠️  Audio status: {status}")
 
-    # Calculate volume
-    rms_volume = calculate_rms(in_data)
+    # Calculate volume (RMS - the "energy" or "loudness" of the chunk)
+    rms_volume = rms_i16(np.frombuffer(in_data, dtype=np.int16))
 
     # Detect beat
     if detect_beat(rms_volume):
@@ -140,6 +130,9 @@ def start_listening():
 
     print("🎵 Initializing audio system...")
 
+    # Compile DSP kernels before the stream opens
+    warm_up_kernels()
+
     # Initialize PyAudio
     p = pyaudio.PyAudio()
 
@@ -153,14 +146,7 @@ def start_listening():
 
     # Open audio stream
     try:
-        audio_stream = p.open(
-            format=pyaudio.paInt16,
-            channels=config.CHANNELS,
-            rate=config.SAMPLE_RATE,
-            input=True,
-            frames_per_buffer=config.CHUNK_SIZE,
-            stream_callback=audio_callback
-        )
+        audio_stream = open_input_stream(p, audio_callback)
 
         print("🎤 Audio stream started - Listening for beats...")
         print(f"⚙️  Settings: Sample Rate={config.SAMPLE_RATE}Hz, Chunk={config.CHUNK_SIZE}, "
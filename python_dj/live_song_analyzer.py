@@ -10,6 +10,7 @@ This script:
 
 Usage:
     python3 live_song_analyzer.py
+    python3 live_song_analyzer.py --list-devices   # Also list audio input devices
 
 Requirements:
     - Microphone or system audio input
@@ -18,15 +19,18 @@ Requirements:
 """
 
 import asyncio
+import io
+import queue
+import sys
+import threading
 import time
 import wave
-import tempfile
-import os
 import numpy as np
-from collections import deque
 from datetime import datetime
 import socketio
 import config
+from _audio_core import (band_table, analyze_bands, rms_i16, i16_to_f32_norm, warm_up_kernels,
+                         open_input_stream, start_emitter, flush_emitter)
 
 # Audio libraries
 try:
@@ -56,16 +60,29 @@ current_artist = None
 current_bpm = 0
 last_recognition_time = 0
 recognition_cooldown = 30  # Seconds between song recognition attempts
+recognition_loop = None    # Long-lived asyncio loop for Shazam requests
+shazam = Shazam() if SHAZAM_AVAILABLE else None
+emit_q = queue.SimpleQueue()  # (event, payload) pairs for start_emitter's thread
 
 # Beat detection
-volume_history = deque(maxlen=30)
-bass_history = deque(maxlen=30)
-last_flash_time = 0
+volume_ema = 0.0  # Smoothed volume baseline
+bass_ema = 0.0    # Smoothed bass baseline
+ema_samples = 0
+last_flash_ns = 0  # time.monotonic_ns() of the last flash
+COOLDOWN_NS = config.COOLDOWN_MS * 1_000_000
 
-# Recording buffer for song recognition
-recognition_buffer = []
+# Recording ring for song recognition (preallocated 16-bit PCM)
 buffer_duration = 10  # Seconds of audio to capture for recognition
+_rec_buf = bytearray(buffer_duration * config.SAMPLE_RATE * config.CHANNELS * 2)
+_rec_pos = 0     # Next write offset into _rec_buf
+_rec_filled = 0  # Bytes of valid audio in _rec_buf
 
+# Bass band (20-250 Hz) FFT bins and its reused output slot
+BASS_BINS = band_table((20, 250))
+_bass_energy = np.zeros(1)
+
+# Normalized float32 copy of the current chunk, filled once per callback
+_pcm_f32 = np.empty(config.CHUNK_SIZE, dtype=np.float32)
 
 # ============================================================================
 # SOCKET.IO HANDLERS
@@ -91,57 +108,36 @@ def connect_error(data):
 # AUDIO ANALYSIS
 # ============================================================================
 
-def calculate_rms(audio_data):
-    """Calculate RMS volume"""
-    if isinstance(audio_data, bytes):
-        audio_array = np.frombuffer(audio_data, dtype=np.int16)
-    else:
-        audio_array = audio_data
-    rms = np.sqrt(np.mean(audio_array**2))
-    return rms
-
-
-def analyze_bass(audio_data, sample_rate):
-    """Extract bass energy (20-250 Hz)"""
-    if isinstance(audio_data, bytes):
-        audio_array = np.frombuffer(audio_data, dtype=np.int16).astype(np.float32)
-    else:
-        audio_array = audio_data.astype(np.float32)
-
-    # Normalize
-    audio_array = audio_array / 32768.0
-
-    # FFT
-    fft = np.fft.rfft(audio_array)
-    freqs = np.fft.rfftfreq(len(audio_array), 1/sample_rate)
-
-    # Bass frequencies
-    bass_mask = (freqs >= 20) & (freqs <= 250)
-    bass_energy = np.sum(np.abs(fft[bass_mask]))
-
-    return bass_energy
+def analyze_bass(pcm_f32, sample_rate):
+    """Extract bass energy (20-250 Hz) from a normalized float32 CHUNK_SIZE chunk at SAMPLE_RATE"""
+    return analyze_bands(pcm_f32, BASS_BINS, _bass_energy)[0]
 
 
 def detect_beat(rms, bass):
     """Detect beat with adaptive thresholding"""
-    global volume_history, bass_history, last_flash_time
+    global volume_ema, bass_ema, ema_samples, last_flash_ns
 
-    volume_history.append(rms)
-    bass_history.append(bass)
+    if ema_samples == 0:
+        volume_ema = rms
+        bass_ema = bass
+    else:
+        volume_ema += config.EMA_ALPHA * (rms - volume_ema)
+        bass_ema += config.EMA_ALPHA * (bass - bass_ema)
+    ema_samples += 1
 
-    if len(volume_history) < 10:
+    if ema_samples < 10:
         return False, 0.0
 
     # Dynamic thresholds
-    avg_vol = np.mean(volume_history)
-    avg_bass = np.mean(bass_history)
+    avg_vol = volume_ema
+    avg_bass = bass_ema
 
     vol_threshold = avg_vol * 1.6  # Increased sensitivity
     bass_threshold = avg_bass * 1.9
 
-    # Check cooldown
-    current_time = time.time() * 1000
-    if current_time - last_flash_time < config.COOLDOWN_MS:
+    # Check cooldown (monotonic clock, immune to wall-clock adjustments)
+    now = time.monotonic_ns()
+    if now - last_flash_ns < COOLDOWN_NS:
         return False, 0.0
 
     # Detect beat (volume spike OR strong bass)
@@ -149,7 +145,7 @@ def detect_beat(rms, bass):
               (bass > bass_threshold and bass > 2000)
 
     if is_beat:
-        last_flash_time = current_time
+        last_flash_ns = now
         # Calculate intensity
         intensity = min(1.0, max(0.4, rms / 4000))
         return True, intensity
@@ -158,43 +154,35 @@ def detect_beat(rms, bass):
 
 
 def send_flash_event(intensity, event_type='rhythm'):
-    """Send flash trigger to server"""
-    try:
-        sio.emit('audio_analysis', {
-            'event_type': event_type,
-            'intensity': intensity,
-            'bpm': current_bpm,
-            'timestamp': time.time()
-        })
+    """Queue flash trigger for the server"""
+    emit_q.put(('audio_analysis', {
+        'event_type': event_type,
+        'intensity': intensity,
+        'bpm': current_bpm,
+        'timestamp': time.time()
+    }))
 
-        # Visual feedback
-        bar = '█' * int(intensity * 25)
-        print(f"⚡ {bar} {intensity*100:.0f}%", end='\r')
-
-    except Exception as e:
-        pass  # Silent fail
+    # Visual feedback
+    bar = '█' * int(intensity * 25)
+    print(f"⚡ {bar} {intensity*100:.0f}%", end='\r')
 
 
 def send_song_info(song_data):
-    """Send recognized song info to server"""
-    try:
-        sio.emit('lyrics_update', {
-            'text': f"♪ {song_data['title']} - {song_data['artist']}",
-            'timestamp': time.time()
-        })
-    except:
-        pass
+    """Queue recognized song info for the server"""
+    emit_q.put(('lyrics_update', {
+        'text': f"♪ {song_data['title']} - {song_data['artist']}",
+        'timestamp': time.time()
+    }))
 
 
 # ============================================================================
 # SONG RECOGNITION
 # ============================================================================
 
-async def recognize_song(audio_file_path):
-    """Use Shazam to identify the song"""
+async def recognize_song(wav_bytes):
+    """Use Shazam to identify the song from in-memory WAV data"""
     try:
-        shazam = Shazam()
-        result = await shazam.recognize(audio_file_path)
+        result = await shazam.recognize(wav_bytes)
 
         if result and 'track' in result:
             track = result['track']
@@ -216,95 +204,121 @@ async def recognize_song(audio_file_path):
         return None
 
 
-def save_audio_buffer_to_file(audio_chunks, sample_rate, channels):
-    """Save recorded audio chunks to temporary WAV file"""
-    # Create temporary file
-    temp_file = tempfile.NamedTemporaryFile(delete=False, suffix='.wav')
-    temp_path = temp_file.name
-    temp_file.close()
+def start_recognition_loop():
+    """Run one asyncio loop on a background thread for all recognition requests"""
+    global recognition_loop
+
+    recognition_loop = asyncio.new_event_loop()
+    threading.Thread(target=recognition_loop.run_forever, daemon=True).start()
+
+
+def handle_recognition_result(future):
+    """Done-callback for a recognition request (runs on the recognition loop thread)"""
+    global current_song, current_artist
+
+    try:
+        song_data = future.result()
+    except Exception as e:
+        print(f"⚠️  Recognition failed: {e}\n")
+        return
 
-    # Write WAV file
-    with wave.open(temp_path, 'wb') as wf:
+    if song_data:
+        current_song = song_data['title']
+        current_artist = song_data['artist']
+
+        print(f"\n🎵 SONG IDENTIFIED!")
+        print(f"   Title: {song_data['title']}")
+        print(f"   Artist: {song_data['artist']}")
+        print(f"   Genre: {song_data.get('genres', 'Unknown')}")
+        print(f"   Album: {song_data.get('album', 'Unknown')}\n")
+
+        # Send to clients
+        send_song_info(song_data)
+    else:
+        print("❓ Could not identify song\n")
+
+
+def append_recognition_audio(audio_data):
+    """Copy a chunk into the recognition ring, overwriting the oldest audio when full"""
+    global _rec_pos, _rec_filled
+
+    n = len(audio_data)
+    end = _rec_pos + n
+    if end <= len(_rec_buf):
+        _rec_buf[_rec_pos:end] = audio_data
+    else:
+        split = len(_rec_buf) - _rec_pos
+        _rec_buf[_rec_pos:] = audio_data[:split]
+        _rec_buf[:end - len(_rec_buf)] = audio_data[split:]
+
+    _rec_pos = end % len(_rec_buf)
+    _rec_filled = min(_rec_filled + n, len(_rec_buf))
+
+
+def encode_recognition_wav(sample_rate, channels):
+    """Encode the recognition ring (oldest audio first) as in-memory WAV bytes"""
+    buf = io.BytesIO()
+
+    # Write WAV data
+    with wave.open(buf, 'wb') as wf:
         wf.setnchannels(channels)
         wf.setsampwidth(2)  # 16-bit
         wf.setframerate(sample_rate)
-        wf.writeframes(b''.join(audio_chunks))
+        ring = memoryview(_rec_buf)
+        if _rec_filled == len(_rec_buf):
+            wf.writeframes(ring[_rec_pos:])
+        wf.writeframes(ring[:_rec_pos])
 
-    return temp_path
+    return buf.getvalue()
 
 
 # ============================================================================
 # MAIN AUDIO PROCESSING
 # ============================================================================
 
-def process_audio_chunk(audio_data, sample_rate):
-    """Process each audio chunk for beat detection and recognition"""
-    global recognition_buffer, last_recognition_time, current_song
+def process_audio_chunk(audio_data, pcm_i16, pcm_f32, sample_rate):
+    """
+    Process each audio chunk for beat detection and recognition.
+    audio_data is the raw callback bytes; pcm_i16 / pcm_f32 are its decoded views.
+    """
+    global _rec_pos, _rec_filled, last_recognition_time
 
-    # Add to recognition buffer
-    recognition_buffer.append(audio_data)
+    # Only record during the window leading up to the next recognition attempt
+    current_time = time.time()
+    if current_time - last_recognition_time >= recognition_cooldown - buffer_duration:
+        append_recognition_audio(audio_data)
 
     # Calculate audio metrics
-    rms = calculate_rms(audio_data)
-    bass = analyze_bass(audio_data, sample_rate)
+    rms = rms_i16(pcm_i16)
+    bass = analyze_bass(pcm_f32, sample_rate)
 
     # Detect beat
     is_beat, intensity = detect_beat(rms, bass)
 
     if is_beat:
-        event_type = 'bass_drop' if bass > np.mean(bass_history) * 2 else 'rhythm'
+        event_type = 'bass_drop' if bass > bass_ema * 2 else 'rhythm'
         send_flash_event(intensity, event_type)
 
     # Try song recognition periodically
-    current_time = time.time()
-    buffer_length = len(recognition_buffer) * config.CHUNK_SIZE / sample_rate
-
-    if buffer_length >= buffer_duration and \
+    if _rec_filled == len(_rec_buf) and \
        (current_time - last_recognition_time) >= recognition_cooldown:
 
         print("\n🔍 Attempting song recognition...")
         last_recognition_time = current_time
 
-        # Save buffer to file
-        temp_file = save_audio_buffer_to_file(
-            recognition_buffer,
+        # Encode buffer as WAV in memory
+        wav_bytes = encode_recognition_wav(
             sample_rate,
             config.CHANNELS
         )
 
-        # Recognize song asynchronously
-        try:
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
-            song_data = loop.run_until_complete(recognize_song(temp_file))
-            loop.close()
-
-            if song_data:
-                current_song = song_data['title']
-                current_artist = song_data['artist']
-
-                print(f"\n🎵 SONG IDENTIFIED!")
-                print(f"   Title: {song_data['title']}")
-                print(f"   Artist: {song_data['artist']}")
-                print(f"   Genre: {song_data.get('genres', 'Unknown')}")
-                print(f"   Album: {song_data.get('album', 'Unknown')}\n")
-
-                # Send to clients
-                send_song_info(song_data)
-            else:
-                print("❓ Could not identify song\n")
-
-        except Exception as e:
-            print(f"⚠️  Recognition failed: {e}\n")
-        finally:
-            # Cleanup
-            try:
-                os.unlink(temp_file)
-            except:
-                pass
+        # Recognize song on the recognition loop - never blocks the audio thread
+        future = asyncio.run_coroutine_threadsafe(recognize_song(wav_bytes), recognition_loop)
+        future.add_done_callback(handle_recognition_result)
 
         # Clear buffer
-        recognition_buffer = []
+        _rec_pos = 0
+        _rec_filled = 0
 
 
 def audio_callback(in_data, frame_count, time_info, status):
@@ -312,8 +326,12 @@ def audio_callback(in_data, frame_count, time_info, status):
     if status:
         print(f"⚠️  {status}")
 
+    # Decode once: zero-copy int16 view plus its normalized float32 companion
+    pcm_i16 = np.frombuffer(in_data, dtype=np.int16)
+    i16_to_f32_norm(pcm_i16, _pcm_f32)
+
     # Process the chunk
-    process_audio_chunk(in_data, config.SAMPLE_RATE)
+    process_audio_chunk(in_data, pcm_i16, _pcm_f32, config.SAMPLE_RATE)
 
     return (in_data, pyaudio.paContinue)
 
@@ -337,6 +355,10 @@ def main():
         print("❌ ShazamIO is required but not installed")
         return
 
+    # Start background workers: socket writer and recognition loop
+    start_emitter(sio, emit_q)
+    start_recognition_loop()
+
     # Connect to server
     print(f"🔌 Connecting to server: {config.SERVER_URL}")
     try:
@@ -347,19 +369,25 @@ def main():
         print("   Make sure server is running: bash start.sh")
         return
 
+    warm_up_kernels()
+
     # Initialize PyAudio
     p = pyaudio.PyAudio()
 
-    print("📡 Available Audio Input Devices:")
-    default_device = None
-    for i in range(p.get_device_count()):
-        info = p.get_device_info_by_index(i)
-        if info['maxInputChannels'] > 0:
-            marker = ""
-            if info.get('index') == p.get_default_input_device_info().get('index'):
-                marker = " [DEFAULT]"
-                default_device = i
-            print(f"  [{i}] {info['name']}{marker}")
+    # Look up the default input once
+    try:
+        default_device = p.get_default_input_device_info()['index']
+    except IOError:
+        default_device = None
+
+    # Full enumeration only on request - it is slow on JACK/PulseAudio setups
+    if '--list-devices' in sys.argv:
+        print("📡 Available Audio Input Devices:")
+        for i in range(p.get_device_count()):
+            info = p.get_device_info_by_index(i)
+            if info['maxInputChannels'] > 0:
+                marker = " [DEFAULT]" if i == default_device else ""
+                print(f"  [{i}] {info['name']}{marker}")
 
     print(f"\n🎤 Using device: {default_device}")
     print("\n" + "="*60)
@@ -372,15 +400,7 @@ def main():
 
     try:
         # Open audio stream
-        stream = p.open(
-            format=pyaudio.paInt16,
-            channels=config.CHANNELS,
-            rate=config.SAMPLE_RATE,
-            input=True,
-            input_device_index=default_device,
-            frames_per_buffer=config.CHUNK_SIZE,
-            stream_callback=audio_callback
-        )
+        stream = open_input_stream(p, audio_callback, device_index=default_device)
 
         print("🎧 Listening for music...\n")
         stream.start_stream()
@@ -402,7 +422,10 @@ def main():
             stream.close()
         p.terminate()
 
+        recognition_loop.call_soon_threadsafe(recognition_loop.stop)
+
         if sio.connected:
+            flush_emitter(emit_q)
             sio.disconnect()
 
         print("\n✅ Cleanup complete!")
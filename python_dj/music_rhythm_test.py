@@ -9,16 +9,21 @@ This script can:
 
 Usage:
     python3 music_rhythm_test.py --live              # Listen to microphone
+    python3 music_rhythm_test.py --live --list-devices  # ...after listing input devices
     python3 music_rhythm_test.py --file song.mp3     # Analyze a music file
     python3 music_rhythm_test.py --help              # Show help
 """
 
 import argparse
+import queue
 import sys
 import time
 import numpy as np
+from scipy import fft as spfft
 import socketio
 import config
+from _audio_core import (RingHistory, band_table, band_energies, band_energies_batch, hann_window,
+                         rms_i16, i16_to_f32_norm, warm_up_kernels, start_emitter, flush_emitter)
 
 # Try to import optional libraries
 try:
@@ -36,65 +41,140 @@ except ImportError:
     LIBROSA_AVAILABLE = False
     print("⚠️  Librosa not available - file analysis features limited")
 
-from collections import deque
+# Optional: CUDA onset envelope for file BPM analysis (librosa on CPU otherwise).
+# torch is imported lazily by cuda_available() - only file mode can use it
+torch = None
+TORCH_CUDA_AVAILABLE = None  # Unknown until the first cuda_available() call
 
 # Initialize Socket.io client
 sio = socketio.Client()
+emit_q = queue.SimpleQueue()  # (event, payload, show_bar) for start_emitter's thread
+
+# Preformatted visual intensity bars, indexed by int(intensity * 20)
+_BARS = ['█' * i for i in range(21)]
 
 # Beat detection state
-volume_history = deque(maxlen=20)
-bass_history = deque(maxlen=20)
-last_flash_time = 0
+volume_history = RingHistory(20)
+bass_history = RingHistory(20)
+COOLDOWN_SAMPLES = config.COOLDOWN_MS * config.SAMPLE_RATE // 1000
+samples_since_flash = COOLDOWN_SAMPLES  # Audio samples analyzed since the last flash
+NOISE_FLOOR_RMS = 200  # Live chunks quieter than this skip the FFT entirely
+
+# FFT bin ranges for bass/mid/high (CHUNK_SIZE and SAMPLE_RATE are fixed, so compute once)
+BAND_BINS = band_table((20, 250), (250, 2000), (2000, 8000))
+_band_energy = np.zeros(len(BAND_BINS))
+
+# Reusable float32 FFT input, refilled from each int16 chunk, and its cached window
+_chunk_f32 = np.empty(config.CHUNK_SIZE, dtype=np.float32)
+_window = hann_window(config.CHUNK_SIZE)
+
+# File analysis runs at a quarter of the live rate (44.1 kHz -> 11.025 kHz): beats
+# and bass sit far below the new Nyquist, and quarter-size chunks keep the live
+# chunk duration and FFT bin spacing, so BAND_BINS still apply (high band clipped)
+FILE_DOWNSAMPLE = 4
+FILE_SAMPLE_RATE = config.SAMPLE_RATE // FILE_DOWNSAMPLE
+FILE_CHUNK_SIZE = config.CHUNK_SIZE // FILE_DOWNSAMPLE
+FILE_BAND_BINS = np.minimum(BAND_BINS, FILE_CHUNK_SIZE // 2 + 1)
+_file_window = hann_window(FILE_CHUNK_SIZE)
 
 
 # ============================================================================
 # AUDIO ANALYSIS FUNCTIONS
 # ============================================================================
 
-def calculate_rms(audio_data):
-    """Calculate Root Mean Square (RMS) volume"""
-    if isinstance(audio_data, bytes):
-        audio_array = np.frombuffer(audio_data, dtype=np.int16)
-    else:
-        audio_array = audio_data
-    rms = np.sqrt(np.mean(audio_array**2))
-    return rms
+def calculate_rms(audio_array):
+    """Calculate Root Mean Square (RMS) volume of int16 samples in a single pass"""
+    return rms_i16(audio_array)
 
 
 def analyze_frequency_bands(audio_data, sample_rate):
-    """Analyze audio across different frequency bands using FFT"""
-    if isinstance(audio_data, bytes):
-        audio_array = np.frombuffer(audio_data, dtype=np.int16).astype(np.float32)
-    else:
-        audio_array = audio_data.astype(np.float32)
+    """Analyze int16 audio across different frequency bands using FFT"""
+    # Fused int16 -> normalized float32 conversion into the preallocated buffer, windowed in place
+    i16_to_f32_norm(audio_data, _chunk_f32)
+    np.multiply(_chunk_f32, _window, out=_chunk_f32)
+
+    # Perform FFT (the buffer is refilled every call, so pocketfft may reuse it)
+    fft = spfft.rfft(_chunk_f32, workers=1, overwrite_x=True)
+
+    # Magnitudes and band sums in one pass over the spectrum
+    bass_energy, mid_energy, high_energy = band_energies(fft, BAND_BINS, _band_energy)
+
+    # Back to int16 scale - detect_beat's thresholds assume it
+    return bass_energy * 32768.0, mid_energy * 32768.0, high_energy * 32768.0
+
+
+def analyze_frames(frames):
+    """
+    Batched calculate_rms + analyze_frequency_bands for a whole file.
+    frames: (n_chunks, FILE_CHUNK_SIZE) float32 array at FILE_SAMPLE_RATE, int16 scale
+            (windowed in place)
+    Returns: (rms, bass, mid, high) arrays with one value per chunk, on the live scale
+    """
+    rms = np.sqrt(np.einsum('ij,ij->i', frames, frames) / frames.shape[1])
 
-    # Normalize
-    if audio_array.dtype == np.int16:
-        audio_array = audio_array / 32768.0
+    # Same unit-RMS Hann window as live mode, applied after RMS
+    np.multiply(frames, _file_window, out=frames)
 
-    # Perform FFT
-    fft = np.fft.rfft(audio_array)
-    frequencies = np.fft.rfftfreq(len(audio_array), 1/sample_rate)
-    magnitudes = np.abs(fft)
+    # One multi-threaded FFT over every chunk, then band sums with chunks split across cores
+    spectrum = spfft.rfft(frames, axis=1, workers=-1)
+    energies = band_energies_batch(spectrum, FILE_BAND_BINS, np.empty((len(frames), len(FILE_BAND_BINS))))
 
-    # Define frequency ranges
-    bass_mask = (frequencies >= 20) & (frequencies <= 250)
-    mid_mask = (frequencies >= 250) & (frequencies <= 2000)
-    high_mask = (frequencies >= 2000) & (frequencies <= 8000)
+    # Magnitudes grow with FFT length - rescale to what a live CHUNK_SIZE FFT reports
+    energies *= FILE_DOWNSAMPLE
+    bass, mid, high = energies.T
 
-    bass_energy = np.sum(magnitudes[bass_mask])
-    mid_energy = np.sum(magnitudes[mid_mask])
-    high_energy = np.sum(magnitudes[high_mask])
+    return rms, bass, mid, high
 
-    return bass_energy, mid_energy, high_energy
 
+def cuda_available():
+    """Import torch on first call and report (cached) whether CUDA can be used"""
+    global torch, TORCH_CUDA_AVAILABLE
 
-def detect_beat(rms_volume, bass_energy):
+    if TORCH_CUDA_AVAILABLE is None:
+        try:
+            import torch
+            TORCH_CUDA_AVAILABLE = torch.cuda.is_available()
+        except ImportError:
+            TORCH_CUDA_AVAILABLE = False
+
+    return TORCH_CUDA_AVAILABLE
+
+
+def onset_envelope_gpu(audio_data, sample_rate, n_fft=2048, hop_length=512):
+    """
+    librosa.onset.onset_strength (default settings) computed on the GPU:
+    framed Hann-windowed rfft -> mel power -> dB -> mean positive spectral flux.
+    Returns: onset envelope as a NumPy array, one value per hop_length frame
+    """
+    x = torch.from_numpy(audio_data).cuda()
+
+    # Centered frames, zero padded like librosa.stft
+    x = torch.nn.functional.pad(x, (n_fft // 2, n_fft // 2))
+    frames = x.unfold(0, n_fft, hop_length)
+    window = torch.hann_window(n_fft, periodic=True, device=x.device)
+    power = torch.fft.rfft(frames * window, dim=-1).abs().pow(2)
+
+    # Mel power spectrogram in dB (power_to_db: ref=1.0, amin=1e-10, top_db=80)
+    mel_basis = torch.from_numpy(librosa.filters.mel(sr=sample_rate, n_fft=n_fft)).to(x.device)
+    mel_db = 10.0 * torch.log10(torch.clamp(power @ mel_basis.T, min=1e-10))
+    mel_db = torch.maximum(mel_db, mel_db.max() - 80.0)
+
+    flux = torch.relu(mel_db[1:] - mel_db[:-1]).mean(dim=1).cpu().numpy()
+
+    # Re-align to frame centers the way librosa pads the envelope
+    onset_env = np.pad(flux, (1 + n_fft // (2 * hop_length), 0))
+    return onset_env[:frames.shape[0]]
+
+
+def detect_beat(rms_volume, bass_energy, chunk_samples):
     """
     Detect if current volume/bass represents a beat.
+    chunk_samples: number of samples in the chunk (advances the cooldown clock)
     Returns: (is_beat, intensity)
     """
-    global last_flash_time, volume_history, bass_history
+    global samples_since_flash, volume_history, bass_history
+
+    samples_since_flash += chunk_samples
 
     volume_history.append(rms_volume)
     bass_history.append(bass_energy)
@@ -103,15 +183,14 @@ def detect_beat(rms_volume, bass_energy):
         return False, 0.0
 
     # Calculate thresholds
-    avg_volume = np.mean(volume_history)
-    avg_bass = np.mean(bass_history)
+    avg_volume = volume_history.mean()
+    avg_bass = bass_history.mean()
 
     volume_threshold = avg_volume * 1.5
     bass_threshold = avg_bass * 1.8
 
-    # Check cooldown
-    current_time = time.time() * 1000
-    if current_time - last_flash_time < config.COOLDOWN_MS:
+    # Check cooldown (counted in samples - no clock reads, no drift)
+    if samples_since_flash < COOLDOWN_SAMPLES:
         return False, 0.0
 
     # Detect beat (strong bass or overall volume spike)
@@ -119,7 +198,7 @@ def detect_beat(rms_volume, bass_energy):
               (bass_energy > bass_threshold and bass_energy > 1000)
 
     if is_beat:
-        last_flash_time = current_time
+        samples_since_flash = 0
         # Calculate intensity (0.0 to 1.0)
         intensity = min(1.0, max(0.3, rms_volume / 5000))
         return True, intensity
@@ -127,18 +206,26 @@ def detect_beat(rms_volume, bass_energy):
     return False, 0.0
 
 
-def send_flash_trigger(intensity=1.0, event_type='beat'):
-    """Send flash trigger to server"""
-    try:
-        if sio.connected:
-            sio.emit('trigger_flash', {
-                'intensity': intensity,
-                'timestamp': time.time(),
-                'event_type': event_type
-            })
-            print(f"⚡ BEAT! Intensity: {intensity:.2f}")
-    except Exception as e:
-        print(f"❌ Error sending trigger: {e}")
+def log_trigger(item):
+    """Console feedback for a queued trigger (runs on the emitter thread, off the audio callback)"""
+    event, payload, show_bar = item
+    intensity = payload['intensity']
+
+    # Visual feedback for triggers coming from the audio callback
+    if show_bar:
+        print("🎵 %s %.0f%%" % (_BARS[min(20, int(intensity * 20))], intensity * 100))
+
+    if sio.connected:
+        print("⚡ BEAT! Intensity: %.2f" % intensity)
+
+
+def send_flash_trigger(intensity=1.0, event_type='beat', show_bar=False):
+    """Queue flash trigger for the server (show_bar: emitter prints the visual bar)"""
+    emit_q.put(('trigger_flash', {
+        'intensity': intensity,
+        'timestamp': time.time(),
+        'event_type': event_type
+    }, show_bar))
 
 
 # ============================================================================
@@ -170,24 +257,29 @@ def audio_callback(in_data, frame_count, time_info, status):
     if status:
         print(f"⚠️  {status}")
 
-    # Calculate metrics
-    rms = calculate_rms(in_data)
-    bass, mid, high = analyze_frequency_bands(in_data, config.SAMPLE_RATE)
+    # Decode once; the compiled kernels read this int16 view directly
+    audio_array = np.frombuffer(in_data, dtype=np.int16)
+
+    # Calculate metrics (silent chunks skip the FFT)
+    rms = calculate_rms(audio_array)
+    if rms >= NOISE_FLOOR_RMS:
+        bass, mid, high = analyze_frequency_bands(audio_array, config.SAMPLE_RATE)
+    else:
+        # Neutral bass: leaves the bass average where it is and can't cross its threshold
+        bass = bass_history.mean()
 
     # Detect beat
-    is_beat, intensity = detect_beat(rms, bass)
+    is_beat, intensity = detect_beat(rms, bass, frame_count)
 
     if is_beat:
-        send_flash_trigger(intensity)
-        # Visual feedback
-        bar = '█' * int(intensity * 20)
-        print(f"🎵 {bar} {intensity*100:.0f}%")
+        # Visual feedback is printed by the emitter thread
+        send_flash_trigger(intensity, show_bar=True)
 
     return (in_data, pyaudio.paContinue)
 
 
-def run_live_mode():
-    """Listen to live microphone input"""
+def run_live_mode(list_devices=False):
+    """Listen to live microphone input (default input device)"""
     if not PYAUDIO_AVAILABLE:
         print("❌ PyAudio is not installed. Cannot use live mode.")
         print("   Install with: pip3 install --break-system-packages pyaudio")
@@ -198,15 +290,25 @@ def run_live_mode():
     print("Starting live audio analysis...")
     print("Play some music near your microphone!\n")
 
+    # Compile DSP kernels before the stream opens
+    warm_up_kernels()
+
     p = pyaudio.PyAudio()
 
-    # List audio devices
-    print("📡 Available audio input devices:")
-    for i in range(p.get_device_count()):
-        info = p.get_device_info_by_index(i)
-        if info['maxInputChannels'] > 0:
-            print(f"  [{i}] {info['name']}")
-    print()
+    # List audio devices (only on request - enumeration is slow on JACK/PulseAudio)
+    if list_devices:
+        try:
+            default_idx = p.get_default_input_device_info()['index']
+        except IOError:
+            default_idx = None
+
+        print("📡 Available audio input devices:")
+        for i in range(p.get_device_count()):
+            info = p.get_device_info_by_index(i)
+            if info['maxInputChannels'] > 0:
+                marker = " [DEFAULT]" if i == default_idx else ""
+                print(f"  [{i}] {info['name']}{marker}")
+        print()
 
     try:
         stream = p.open(
@@ -252,37 +354,42 @@ def analyze_music_file(file_path):
 
     try:
         # Load audio file
-        audio_data, sample_rate = librosa.load(file_path, sr=config.SAMPLE_RATE, mono=True)
+        audio_data, sample_rate = librosa.load(file_path, sr=FILE_SAMPLE_RATE, mono=True)
         duration = len(audio_data) / sample_rate
 
         print(f"✅ Loaded: {duration:.1f} seconds")
         print(f"   Sample rate: {sample_rate} Hz")
         print(f"   Total samples: {len(audio_data)}")
 
-        # Estimate BPM
-        tempo, beats = librosa.beat.beat_track(y=audio_data, sr=sample_rate)
+        # Estimate BPM (onset envelope on the GPU when CUDA is available)
+        if cuda_available():
+            onset_env = onset_envelope_gpu(audio_data, sample_rate)
+            tempo, beats = librosa.beat.beat_track(onset_envelope=onset_env, sr=sample_rate)
+        else:
+            tempo, beats = librosa.beat.beat_track(y=audio_data, sr=sample_rate)
         print(f"   Estimated BPM: {tempo:.0f}")
         print(f"   Detected beats: {len(beats)}")
 
-        # Analyze in chunks
-        print("\n🎧 Playing and analyzing...\n")
+        chunk_size = FILE_CHUNK_SIZE
 
-        chunk_size = config.CHUNK_SIZE
-        total_chunks = len(audio_data) // chunk_size
-        beat_count = 0
+        # Analyze every chunk up front in one batch (int16 scale, like live mode)
+        frames = librosa.util.frame(audio_data, frame_length=chunk_size,
+                                    hop_length=chunk_size, axis=0) * np.float32(32767)
+        rms_all, bass_all, mid_all, high_all = analyze_frames(frames)
 
-        for i in range(0, len(audio_data) - chunk_size, chunk_size):
-            chunk = audio_data[i:i+chunk_size]
+        # Replay the results at playback pace
+        print("\n🎧 Playing and analyzing...\n")
 
-            # Convert to int16 for consistency
-            chunk_int16 = (chunk * 32767).astype(np.int16)
+        total_chunks = len(frames)
+        beat_count = 0
 
-            # Analyze
-            rms = calculate_rms(chunk_int16)
-            bass, mid, high = analyze_frequency_bands(chunk_int16, sample_rate)
+        for n in range(total_chunks):
+            i = n * chunk_size
+            rms = rms_all[n]
+            bass = bass_all[n]
 
             # Detect beat
-            is_beat, intensity = detect_beat(rms, bass)
+            is_beat, intensity = detect_beat(rms, bass, chunk_size * FILE_DOWNSAMPLE)
 
             if is_beat:
                 beat_count += 1
@@ -291,7 +398,7 @@ def analyze_music_file(file_path):
                 # Show progress with visual beat indicator
                 progress = (i / len(audio_data)) * 100
                 timestamp = i / sample_rate
-                bar = '█' * int(intensity * 20)
+                bar = _BARS[min(20, int(intensity * 20))]
                 print(f"⚡ [{timestamp:6.2f}s] {bar} {intensity*100:.0f}%")
 
             # Simulate real-time playback
@@ -341,6 +448,8 @@ Examples:
                        help='Path to music file (MP3, WAV, etc.)')
     parser.add_argument('--no-server', action='store_true',
                        help='Run without connecting to server')
+    parser.add_argument('--list-devices', action='store_true',
+                       help='List audio input devices before starting live mode')
 
     args = parser.parse_args()
 
@@ -364,10 +473,12 @@ Examples:
             print(f"⚠️  Could not connect to server: {e}")
             print("   Continuing without server connection...")
 
+    start_emitter(sio, emit_q, on_emit=log_trigger)
+
     try:
         # Run selected mode
         if args.live:
-            run_live_mode()
+            run_live_mode(list_devices=args.list_devices)
         elif args.file:
             analyze_music_file(args.file)
 
@@ -375,6 +486,7 @@ Examples:
         print("\n⚠️  Interrupted by user")
     finally:
         if sio.connected:
+            flush_emitter(emit_q)
             sio.disconnect()
         print("\n✅ Done!")
 
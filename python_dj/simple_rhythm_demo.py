@@ -12,11 +12,13 @@ Usage:
     python3 simple_rhythm_demo.py song.mp3           # Analyze a music file
 """
 
+import queue
 import sys
 import time
 import numpy as np
 import socketio
 import config
+from _audio_core import RingHistory, start_emitter, flush_emitter
 
 # Check for optional librosa
 try:
@@ -27,15 +29,22 @@ except ImportError:
     print("⚠️  Librosa not installed - file analysis disabled")
     print("   Install with: pip3 install --break-system-packages librosa soundfile")
 
-from collections import deque
-
 # Socket.io client
 sio = socketio.Client()
+emit_q = queue.SimpleQueue()  # (event, payload) pairs for start_emitter's thread
+
+# Preformatted visual intensity bars, indexed by int(intensity * 30)
+_BARS = ['█' * i for i in range(31)]
+
+# File analysis framing
+FILE_SAMPLE_RATE = 22050
+FILE_CHUNK_SIZE = 2048
 
 # Beat detection state
-volume_history = deque(maxlen=20)
-bass_history = deque(maxlen=20)
-last_flash_time = 0
+volume_history = RingHistory(20)
+bass_history = RingHistory(20)
+COOLDOWN_SAMPLES = config.COOLDOWN_MS * FILE_SAMPLE_RATE // 1000
+samples_since_flash = COOLDOWN_SAMPLES  # Audio samples analyzed since the last flash
 
 
 @sio.event
@@ -49,24 +58,19 @@ def disconnect():
     print("❌ Disconnected from server")
 
 
-def calculate_rms(audio_data):
-    """Calculate RMS volume"""
-    return np.sqrt(np.mean(audio_data**2))
+def analyze_frames(frames):
+    """
+    Analyze a whole file framed as (n_chunks, FILE_CHUNK_SIZE).
+    Returns: RMS volume array with one value per chunk
+    """
+    return np.sqrt(np.einsum('ij,ij->i', frames, frames) / frames.shape[1])
 
 
-def analyze_bass(audio_data, sample_rate):
-    """Extract bass energy from audio"""
-    # Simple low-pass filter for bass frequencies (20-250 Hz)
-    fft = np.fft.rfft(audio_data)
-    freqs = np.fft.rfftfreq(len(audio_data), 1/sample_rate)
-    bass_mask = (freqs >= 20) & (freqs <= 250)
-    bass_energy = np.sum(np.abs(fft[bass_mask]))
-    return bass_energy
+def detect_beat(rms, bass, chunk_samples):
+    """Simple beat detection algorithm (chunk_samples advances the cooldown clock)"""
+    global volume_history, bass_history, samples_since_flash
 
-
-def detect_beat(rms, bass):
-    """Simple beat detection algorithm"""
-    global volume_history, bass_history, last_flash_time
+    samples_since_flash += chunk_samples
 
     volume_history.append(rms)
     bass_history.append(bass)
@@ -75,16 +79,15 @@ def detect_beat(rms, bass):
         return False, 0.0
 
     # Dynamic thresholds
-    avg_vol = np.mean(volume_history)
-    avg_bass = np.mean(bass_history)
+    avg_vol = volume_history.mean()
+    avg_bass = bass_history.mean()
 
     # Beat conditions
     is_beat = (rms > avg_vol * 1.5 or bass > avg_bass * 1.8)
 
-    # Cooldown
-    current_time = time.time() * 1000
-    if is_beat and (current_time - last_flash_time) >= config.COOLDOWN_MS:
-        last_flash_time = current_time
+    # Cooldown (counted in samples at FILE_SAMPLE_RATE)
+    if is_beat and samples_since_flash >= COOLDOWN_SAMPLES:
+        samples_since_flash = 0
         intensity = min(1.0, max(0.3, rms / 5000))
         return True, intensity
 
@@ -92,15 +95,12 @@ def detect_beat(rms, bass):
 
 
 def send_trigger(intensity, event_type='beat'):
-    """Send trigger to server"""
-    try:
-        sio.emit('trigger_flash', {
-            'intensity': intensity,
-            'timestamp': time.time(),
-            'event_type': event_type
-        })
-    except:
-        pass
+    """Queue trigger for the server"""
+    emit_q.put(('trigger_flash', {
+        'intensity': intensity,
+        'timestamp': time.time(),
+        'event_type': event_type
+    }))
 
 
 def simulate_beats():
@@ -121,20 +121,27 @@ def simulate_beats():
     ]
 
     try:
+        # Absolute beat deadlines: emit/print time never pushes later beats back
+        start = time.monotonic()
+        beat_number = 0
+
         for pattern in patterns:
             print(f"\n🎼 Pattern: {pattern['name']}")
             print(f"   BPM: {bpm}")
 
             for i, intensity in enumerate(pattern['beats']):
                 # Visual feedback
-                bar = '█' * int(intensity * 30)
+                bar = _BARS[min(30, int(intensity * 30))]
                 print(f"   Beat {i+1}: {bar} {intensity*100:.0f}%")
 
                 # Send trigger
                 send_trigger(intensity, event_type='simulated')
 
                 # Wait for next beat
-                time.sleep(beat_interval)
+                beat_number += 1
+                delay = start + beat_number * beat_interval - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
 
             print()
 
@@ -157,7 +164,7 @@ def analyze_music_file(file_path):
     try:
         # Load audio
         print("📂 Loading audio file...")
-        audio, sr = librosa.load(file_path, sr=22050, mono=True)
+        audio, sr = librosa.load(file_path, sr=FILE_SAMPLE_RATE, mono=True)
         duration = len(audio) / sr
 
         print(f"✅ Loaded successfully!")
@@ -176,17 +183,18 @@ def analyze_music_file(file_path):
         # Process in chunks and detect beats
         print("🎧 Processing and sending triggers...\n")
 
-        chunk_size = 2048
+        chunk_size = FILE_CHUNK_SIZE
         beat_count = 0
         beat_idx = 0
 
-        for i in range(0, len(audio) - chunk_size, chunk_size):
-            chunk = audio[i:i+chunk_size]
-            current_time = i / sr
+        # Calculate metrics for every chunk up front
+        frames = librosa.util.frame(audio, frame_length=chunk_size, hop_length=chunk_size, axis=0)
+        rms_all = analyze_frames(frames)
 
-            # Calculate metrics
-            rms = calculate_rms(chunk)
-            bass = analyze_bass(chunk, sr)
+        for n in range(len(frames)):
+            i = n * chunk_size
+            current_time = i / sr
+            rms = rms_all[n]
 
             # Check if we're near a detected beat
             if beat_idx < len(beat_times) and abs(current_time - beat_times[beat_idx]) < 0.1:
@@ -194,7 +202,7 @@ def analyze_music_file(file_path):
                 intensity = min(1.0, rms * 10)
 
                 # Visual feedback
-                bar = '█' * int(intensity * 30)
+                bar = _BARS[min(30, int(intensity * 30))]
                 print(f"⚡ [{current_time:6.2f}s] {bar} {intensity*100:.0f}%")
 
                 # Send trigger
@@ -234,6 +242,8 @@ def main():
         print("   Run: bash start.sh")
         return
 
+    start_emitter(sio, emit_q)
+
     # Check for file argument
     if len(sys.argv) > 1:
         music_file = sys.argv[1]
@@ -241,7 +251,8 @@ def main():
     else:
         simulate_beats()
 
-    # Disconnect
+    # Send whatever is still queued, then disconnect
+    flush_emitter(emit_q)
     sio.disconnect()
     print("\n✅ Demo complete!")
     print("   Check your browser at http://localhost:3000/demo")